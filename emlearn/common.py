@@ -8,6 +8,7 @@ import os
 import sys
 import subprocess
 import platform
+import tempfile
 from distutils.ccompiler import new_compiler
 
 def get_include_dir() -> str:
@@ -103,9 +104,12 @@ def run_classifier(bin_path, data, out_dtype='int', float_precision=8):
     return outputs
 
 class CompiledClassifier():
-    def __init__(self, cmodel, name, call=None, include_dir=None, temp_dir='tmp', test_function=None, out_dtype='int'):
+    def __init__(self, cmodel, name, call=None, include_dir=None, temp_dir=None, test_function=None, out_dtype='int'):
         if include_dir == None:
             include_dir = get_include_dir()
+        if temp_dir == None:
+            # use a unique directory, to allow multiple processes to compile concurrently
+            temp_dir = tempfile.mkdtemp(prefix='emlearn_')
         self.bin_path = build_classifier(cmodel, name,
                 include_dir=include_dir, temp_dir=temp_dir, func=call, test_function=test_function) 
         self._out_dtype = out_dtype
@@ -3,4 +3,6 @@ echo $PYTHONPATH
 python3 setup.py build
 # To run a single test only
 # python3 -m pytest -v --cov=emlearn --cov-report html --cov-report term-missing --cov-branch test/ -k test_window_function_hann -s
+# To run tests in parallel (requires pytest-xdist)
+# python3 -m pytest -n auto test/
 python3 -m pytest -v --cov=emlearn --cov-report html --cov-report term-missing --cov-branch test/
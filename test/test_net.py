@@ -17,9 +17,8 @@ from sklearn.datasets import make_regression
 from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.preprocessing import StandardScaler, MultiLabelBinarizer
 
-from tensorflow import keras
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Dense, Activation
+# TensorFlow is only imported inside the Keras tests,
+# to avoid paying its startup cost when running just the sklearn tests
 
 def test_unsupported_activation():
     with warnings.catch_warnings():
@@ -33,12 +32,37 @@ def test_unsupported_activation():
     assert 'fake22' in str(ex.value)
 
 
-def assert_equivalent_sklearn(model, X_test, n_classes, method):
-    cmodel = emlearn.convert(model, method=method)
-
-    cpred = cmodel.predict(X_test)
-    pred = model.predict(X_test)
-    assert_equal(pred, cpred)
+@pytest.fixture(scope='session')
+def classification_dataset(request):
+    # shared across tests/parametrizations, keyed on (features, classes)
+    features, classes = request.param
+    rng = numpy.random.RandomState(0)
+    X, y = make_classification(n_features=features, n_classes=classes,
+                               n_redundant=0, n_informative=features,
+                               random_state=rng, n_clusters_per_class=1, n_samples=50)
+    X += 2 * rng.uniform(size=X.shape)
+    X = StandardScaler().fit_transform(X)
+    return train_test_split(X, y, test_size=.2)
+
+@pytest.fixture(scope='session')
+def regression_dataset(request):
+    # shared across tests/parametrizations, keyed on features
+    features = request.param
+    rng = numpy.random.RandomState(0)
+    X, y = make_regression(n_features=features,
+                           n_informative=features,
+                           random_state=rng, n_samples=50)
+    X += 2 * rng.uniform(size=X.shape)
+    X = StandardScaler().fit_transform(X)
+    return train_test_split(X, y, test_size=.2)
+
+
+def assert_equivalent_sklearn(model, X_test, ref_pred, methods):
+    # reference prediction is precomputed, emlearn.convert is the only per-method work
+    for method in methods:
+        cmodel = emlearn.convert(model, method=method)
+        cpred = cmodel.predict(X_test)
+        assert_equal(ref_pred, cpred)
 
 
 SKLEARN_PARAMS = [
@@ -47,67 +71,57 @@ SKLEARN_PARAMS = [
     ( dict(hidden_layer_sizes=(4,5,3)), {'classes': 5, 'features': 5}),
 ]
 
-@pytest.mark.parametrize('modelparams,params', SKLEARN_PARAMS)
-def test_sklearn_predict(modelparams,params):
+@pytest.mark.parametrize('modelparams,params,classification_dataset',
+        [ (m, p, (p['features'], p['classes'])) for m, p in SKLEARN_PARAMS ],
+        indirect=['classification_dataset'])
+def test_sklearn_predict(modelparams, params, classification_dataset):
 
     model = MLPClassifier(**modelparams, max_iter=10)
 
-    for random in range(0, 3):
-        # create dataset
-        rng = numpy.random.RandomState(0)
-        X, y = make_classification(n_features=params['features'], n_classes=params['classes'],
-                                   n_redundant=0, n_informative=params['features'],
-                                   random_state=rng, n_clusters_per_class=1, n_samples=50)
-        X += 2 * rng.uniform(size=X.shape)
-        X = StandardScaler().fit_transform(X)
-
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=.2)
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            model.fit(X_train, y_train)
+    X_train, X_test, y_train, y_test = classification_dataset
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        model.fit(X_train, y_train)
 
-            cmodel = emlearn.convert(model)
+        cmodel = emlearn.convert(model)
 
-            X_test = X_test[:3]
-            cproba = cmodel.predict_proba(X_test)
-            proba = model.predict_proba(X_test)
+        X_test = X_test[:3]
+        ref_pred = model.predict(X_test)
+        cproba = cmodel.predict_proba(X_test)
+        proba = model.predict_proba(X_test)
 
-        assert_equivalent_sklearn(model, X_test, params['classes'], method='inline')
-        assert_equivalent_sklearn(model, X_test, params['classes'], method='pymodule')
-        assert_equivalent_sklearn(model, X_test, params['classes'], method='loadable')
-        assert_almost_equal(proba, cproba, decimal=6)
+    assert_equivalent_sklearn(model, X_test, ref_pred, methods=('inline', 'pymodule', 'loadable'))
+    assert_almost_equal(proba, cproba, decimal=6)
 
 
 
-@pytest.mark.parametrize('modelparams,params', SKLEARN_PARAMS)
-def test_sklearn_regress(modelparams,params):
+@pytest.mark.parametrize('modelparams,params,regression_dataset',
+        [ (m, p, p['features']) for m, p in SKLEARN_PARAMS ],
+        indirect=['regression_dataset'])
+def test_sklearn_regress(modelparams, params, regression_dataset):
 
     model = MLPRegressor(**modelparams, max_iter=10)
 
-    for random in range(0, 3):
-        # create dataset
-        rng = numpy.random.RandomState(0)
-        X, y = make_regression(n_features=params['features'], 
-                               n_informative=params['features'],
-                               random_state=rng, n_samples=50)
-        X += 2 * rng.uniform(size=X.shape)
-        X = StandardScaler().fit_transform(X)
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=.2)
-
-        # train model
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            model.fit(X_train, y_train)
-
-        # check equivalence
-        cmodel = emlearn.convert(model)
-        X_test = X_test[:3]
-        assert_equivalent_float(model, X_test, method='loadable')
-        #assert_equivalent_float(model, X_test, method='inline') # not supported at the moment
+    X_train, X_test, y_train, y_test = regression_dataset
+
+    # train model
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        model.fit(X_train, y_train)
+
+    # check equivalence
+    cmodel = emlearn.convert(model)
+    X_test = X_test[:3]
+    assert_equivalent_float(model, X_test, method='loadable')
+    #assert_equivalent_float(model, X_test, method='inline') # not supported at the moment
 
 
 
 def keras_mlp_multiclass_activation_layers(features, classes, activation='relu'):
+    keras = pytest.importorskip('tensorflow.keras')
+    Sequential = keras.models.Sequential
+    Dense = keras.layers.Dense
+    Activation = keras.layers.Activation
     model = Sequential([
         Dense(8, input_dim=features),
         Activation(activation),
@@ -120,6 +134,9 @@ def keras_mlp_multiclass_activation_layers(features, classes, activation='relu')
     return model, dict(features=features, classes=classes) 
 
 def keras_mlp_binary_activation_params(features, activation='relu'):
+    keras = pytest.importorskip('tensorflow.keras')
+    Sequential = keras.models.Sequential
+    Dense = keras.layers.Dense
     model = Sequential([
         Dense(16, input_dim=features, activation=activation),
         Dense(8, activation=activation),
@@ -131,6 +148,9 @@ def keras_mlp_binary_activation_params(features, activation='relu'):
     return model, dict(features=features, classes=2)
 
 def keras_dropout_relu_softmax(features, classes):
+    keras = pytest.importorskip('tensorflow.keras')
+    Sequential = keras.models.Sequential
+    Dense = keras.layers.Dense
     # Using the specific layer names instead of general Dense,Activation
     model = Sequential([
         Dense(8, input_shape=(features,)),
@@ -147,30 +167,40 @@ def keras_dropout_relu_softmax(features, classes):
 # TODO: support CNNs. Conv1D/2D, (ZeroPadding1D/2D), Average/MaxPooling1D/2D, Flatten
 # TODO: support simple functional Models, like Logistic Regression. Input+Dense+Softmax
 
-KERAS_MODELS = {
-    'MLP.binary': keras_mlp_binary_activation_params(3),
-    'MLP.4ary.actlayer': keras_mlp_multiclass_activation_layers(3, 4),
+# plain data, usable at collection time without importing TensorFlow
+KERAS_MODEL_PARAMS = {
+    'MLP.binary': dict(features=3, classes=2),
+    'MLP.4ary.actlayer': dict(features=3, classes=4),
+    'Dropout.Relu.Softmax': dict(features=3, classes=4),
 }
 
-KERAS_REGRESSION_MODELS = {
-    'MLP.binary': keras_mlp_binary_activation_params(3),
+KERAS_REGRESSION_MODEL_PARAMS = {
+    'MLP.binary': dict(features=3, classes=2),
 }
 
-if getattr(keras.layers, 'ReLu', None):
-    KERAS_MODELS['Dropout.Relu.Softmax'] = keras_dropout_relu_softmax(3, 4),
+# factories, so each test builds its own model instance on demand
+KERAS_MODEL_FACTORIES = {
+    'MLP.binary': lambda: keras_mlp_binary_activation_params(3),
+    'MLP.4ary.actlayer': lambda: keras_mlp_multiclass_activation_layers(3, 4),
+    'Dropout.Relu.Softmax': lambda: keras_dropout_relu_softmax(3, 4),
+}
 
-def assert_equivalent(model, X_test, n_classes, method):
-    cmodel = emlearn.convert(model, method=method)
+KERAS_REGRESSION_MODEL_FACTORIES = {
+    'MLP.binary': lambda: keras_mlp_binary_activation_params(3),
+}
 
+def assert_equivalent(model, X_test, n_classes, methods):
     # TODO: support predict_proba, use that instead
-    cpred = cmodel.predict(X_test)
     pred = model.predict(X_test)
     if n_classes == 2:
         pred = (pred[:,0] > 0.5).astype(int)
     else:
         pred = numpy.argmax(pred, axis=1)
 
-    assert_equal(pred, cpred)
+    for method in methods:
+        cmodel = emlearn.convert(model, method=method)
+        cpred = cmodel.predict(X_test)
+        assert_equal(pred, cpred)
 
 def assert_equivalent_float(model, X_test, method):
     cmodel = emlearn.convert(model, method=method, return_type='regressor')
@@ -181,49 +211,33 @@ def assert_equivalent_float(model, X_test, method):
     # assert_equal(pred, cpred)
     numpy.testing.assert_almost_equal(cpred, pred, decimal=4)
 
-@pytest.mark.parametrize('modelname', KERAS_MODELS.keys())
-def test_net_keras_predict(modelname):
-    model, params = KERAS_MODELS[modelname]
-
-    for _ in range(0, 3):
-        # create dataset
-        rng = numpy.random.RandomState(0)
-        X, y = make_classification(n_features=params['features'], n_classes=params['classes'],
-                                   n_redundant=0, n_informative=params['features'],
-                                   random_state=rng, n_clusters_per_class=1, n_samples=50)
-        X += 2 * rng.uniform(size=X.shape)
-        X = StandardScaler().fit_transform(X)
-
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=.2)
-        if params['classes'] != 2:
-            class_names = None
-            y_train = MultiLabelBinarizer(classes=class_names).fit_transform(y_train.reshape(-1, 1))
-
-        model.fit(X_train, y_train, epochs=1, batch_size=10)
-        X_test = X_test[:3]
+@pytest.mark.parametrize('modelname,classification_dataset',
+        [ (name, (p['features'], p['classes'])) for name, p in KERAS_MODEL_PARAMS.items() ],
+        indirect=['classification_dataset'])
+def test_net_keras_predict(modelname, classification_dataset):
+    model, params = KERAS_MODEL_FACTORIES[modelname]()
 
-        # check each method. Done here instead of using parameters to save time, above is slow
-        assert_equivalent(model, X_test[:3], params['classes'], method='inline')
-        assert_equivalent(model, X_test[:3], params['classes'], method='pymodule')
-        assert_equivalent(model, X_test[:3], params['classes'], method='loadable')
+    X_train, X_test, y_train, y_test = classification_dataset
+    if params['classes'] != 2:
+        class_names = None
+        y_train = MultiLabelBinarizer(classes=class_names).fit_transform(y_train.reshape(-1, 1))
 
+    model.fit(X_train, y_train, epochs=1, batch_size=10)
+    X_test = X_test[:3]
 
-@pytest.mark.parametrize('modelname', KERAS_REGRESSION_MODELS.keys())
-def test_net_keras_regress(modelname):
-    model, params = KERAS_REGRESSION_MODELS[modelname]
+    # check each method. Done here instead of using parameters to save time, above is slow
+    assert_equivalent(model, X_test, params['classes'], methods=('inline', 'pymodule', 'loadable'))
 
-    for _ in range(0, 3):
-        # create dataset
-        rng = numpy.random.RandomState(0)
-        X, y = make_regression(n_features=params['features'], 
-                               n_informative=params['features'],
-                               random_state=rng, n_samples=50)
-        X += 2 * rng.uniform(size=X.shape)
-        X = StandardScaler().fit_transform(X)
 
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=.2)
+@pytest.mark.parametrize('modelname,regression_dataset',
+        [ (name, p['features']) for name, p in KERAS_REGRESSION_MODEL_PARAMS.items() ],
+        indirect=['regression_dataset'])
+def test_net_keras_regress(modelname, regression_dataset):
+    model, params = KERAS_REGRESSION_MODEL_FACTORIES[modelname]()
 
-        model.fit(X_train, y_train, epochs=1, batch_size=10)
-        X_test = X_test[:3]
+    X_train, X_test, y_train, y_test = regression_dataset
+
+    model.fit(X_train, y_train, epochs=1, batch_size=10)
+    X_test = X_test[:3]
 
-        assert_equivalent_float(model, X_test[:3], method='loadable')
+    assert_equivalent_float(model, X_test, method='loadable')